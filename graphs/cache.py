@@ -0,0 +1,214 @@
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from graphs.embeddings import EMBEDDINGS_AVAILABLE, unpack_embedding
+
+# The semantic tier is optional: without faiss (or the embedding stack) the
+# cache still serves exact repeats of a question through its sha256 key.
+try:
+    import numpy as np
+    import faiss
+except ImportError:
+    faiss = None
+
+
+# Answers live next to the LangGraph checkpoints, but in their own file: the async
+# checkpointer keeps a connection open on the event loop, and a blocking write to
+# the same file from a node would wait on that connection's lock.
+CHECKPOINT_DB = "checkpoints/langgraph_memory.sqlite"
+CACHE_DB = "checkpoints/answer_cache.sqlite"
+
+# Connection tuning shared by the checkpointer and the answer cache. WAL plus
+# synchronous=NORMAL syncs at checkpoint time instead of on every commit, which
+# matters because LangGraph writes a checkpoint after every node.
+SQLITE_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-65536;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+"""
+
+# Minimum cosine similarity for a stored question to count as the same question.
+SIMILARITY_THRESHOLD = 0.92
+
+
+class AnswerCache:
+    """
+    Two-tier cache of accepted answers, keyed by question.
+    - Exact tier: sha256 of the question text, looked up in SQLite.
+    - Semantic tier: inner-product FAISS index over normalized question embeddings,
+      so near-duplicate phrasings of an answered question also hit.
+    The semantic tier takes the question embedding computed once per run, so the
+    exact tier can be tried before paying for an encode. Its index is only built
+    from the first embedding it sees, so opening the cache never loads the model.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SQLITE_PRAGMAS)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answer_cache ("
+            "question_hash TEXT PRIMARY KEY, "
+            "question TEXT NOT NULL, "
+            "embedding BLOB, "
+            "final_answer TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+        # FAISS row i corresponds to self._index_hashes[i]
+        self._semantic = EMBEDDINGS_AVAILABLE and faiss is not None
+        self._index = None
+        self._index_hashes: list[str] = []
+
+    def _ensure_index(self, question_embedding: bytes):
+        """Builds the index on first use, sized from an embedding (not from the model)."""
+        if self._index is not None:
+            return
+        self._index = faiss.IndexFlatIP(unpack_embedding(question_embedding).shape[0])
+        rows = self._conn.execute(
+            "SELECT question_hash, embedding FROM answer_cache WHERE embedding IS NOT NULL"
+        ).fetchall()
+        if rows:
+            vectors = np.stack([unpack_embedding(blob) for _, blob in rows])
+            self._index.add(vectors)
+            self._index_hashes = [question_hash for question_hash, _ in rows]
+
+    @staticmethod
+    def _hash(question: str) -> str:
+        return hashlib.sha256(question.encode()).hexdigest()
+
+    @staticmethod
+    def _as_row(question_embedding: bytes):
+        return unpack_embedding(question_embedding).reshape(1, -1)
+
+    def _answer_for(self, question_hash: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT final_answer FROM answer_cache WHERE question_hash = ?", (question_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def lookup_exact(self, question: str) -> Optional[str]:
+        """Returns the cached final answer for exactly this question, if any."""
+        return self._answer_for(self._hash(question))
+
+    def lookup_similar(self, question_embedding: bytes) -> Optional[str]:
+        """Returns the cached final answer of the nearest stored question, if it is close enough."""
+        if not self._semantic:
+            return None
+        self._ensure_index(question_embedding)
+        if self._index.ntotal == 0:
+            return None
+        scores, positions = self._index.search(self._as_row(question_embedding), 1)
+        if scores[0][0] >= SIMILARITY_THRESHOLD:
+            return self._answer_for(self._index_hashes[positions[0][0]])
+        return None
+
+    def store(self, question: str, final_answer: str, question_embedding: Optional[bytes] = None):
+        """Upserts an accepted answer for the question. Without an embedding it is
+        only served to exact repeats."""
+        question_hash = self._hash(question)
+        is_new = self._answer_for(question_hash) is None
+
+        embedding = None
+        if self._semantic and is_new and question_embedding is not None:
+            self._ensure_index(question_embedding)
+            embedding = question_embedding
+            self._index.add(self._as_row(question_embedding))
+            self._index_hashes.append(question_hash)
+
+        self._conn.execute(
+            "INSERT INTO answer_cache (question_hash, question, embedding, final_answer) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(question_hash) DO UPDATE SET final_answer = excluded.final_answer",
+            (question_hash, question, embedding, final_answer),
+        )
+        self._conn.commit()
+
+
+class ResearchStore:
+    """
+    Content-addressed store for research contexts.
+    The graph state only carries the digests of the sources each research cycle
+    added, so the checkpoint written after every node stays small however much is
+    gathered, and every cycle stores only its own sources rather than a copy of all
+    the research so far. Digests are scoped by a namespace (the question), so a run
+    can delete the previous run's blobs without touching another question's.
+    Blocking calls are meant to be run through asyncio.to_thread from the graph nodes.
+    """
+
+    # Recently used blobs kept in memory; a draft re-reads every cycle's sources
+    _MEMO_SIZE = 32
+
+    def __init__(self, db_path: str = CACHE_DB):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SQLITE_PRAGMAS)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS research_blobs ("
+            "digest TEXT PRIMARY KEY, "
+            "research_data TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        # Calls arrive from worker threads; sqlite3 connections are not safe to share unguarded
+        self._lock = threading.Lock()
+        self._memo: OrderedDict[str, str] = OrderedDict()
+
+    def _remember(self, digest: str, research_data: str):
+        self._memo[digest] = research_data
+        self._memo.move_to_end(digest)
+        if len(self._memo) > self._MEMO_SIZE:
+            self._memo.popitem(last=False)
+
+    def put(self, research_data: str, namespace: str = "") -> str:
+        """Stores a research context (or one cycle's part of it) and returns its digest."""
+        digest = hashlib.sha256(f"{namespace}\0{research_data}".encode()).hexdigest()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO research_blobs (digest, research_data) VALUES (?, ?)",
+                (digest, research_data),
+            )
+            self._conn.commit()
+            self._remember(digest, research_data)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """Returns the research context stored under a digest."""
+        with self._lock:
+            if digest in self._memo:
+                self._memo.move_to_end(digest)
+                return self._memo[digest]
+            row = self._conn.execute(
+                "SELECT research_data FROM research_blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"No research stored under digest {digest}")
+            self._remember(digest, row[0])
+            return row[0]
+
+    def load(self, digests: list[str]) -> str:
+        """Returns the research contexts stored under the digests, joined in order."""
+        return "\n\n".join(self.get(digest) for digest in digests)
+
+    def delete(self, digests: list[str]):
+        """Removes research contexts that no run will read again."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM research_blobs WHERE digest = ?", [(d,) for d in digests])
+            self._conn.commit()
+            for digest in digests:
+                self._memo.pop(digest, None)
+
+
+@lru_cache(maxsize=None)
+def get_answer_cache() -> AnswerCache:
+    """Returns the process-wide answer cache."""
+    return AnswerCache()
+
+
+@lru_cache(maxsize=None)
+def get_research_store() -> ResearchStore:
+    """Returns the process-wide research store."""
+    return ResearchStore()
@@ -0,0 +1,144 @@
+from functools import lru_cache
+
+import httpx
+from google import genai
+from google.genai import errors
+from google.genai.types import Content, CreateCachedContentConfig, HttpOptions, Part
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai._common import get_user_agent
+from langchain_google_genai.chat_models import _ClientCleanup
+from langchain_community.utilities.tavily_search import TAVILY_API_URL, TavilySearchAPIWrapper
+
+
+# --- Shared HTTP/2 connection pool ---
+# Every Gemini and Tavily request goes through this one client, so retry cycles
+# and parallel searches reuse warm sockets instead of paying TCP + TLS setup per call.
+# The client binds to the event loop it is first used on; close it with
+# close_http_client() before that loop shuts down.
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the process-wide async HTTP/2 client."""
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+    )
+
+
+# Cached factories whose products hold the shared client (see pooled_factory)
+_POOLED_FACTORIES = []
+
+
+def pooled_factory(factory):
+    """Registers an lru_cache'd factory whose results keep a reference to the shared
+    client, so close_http_client() drops them along with it and the next event loop
+    rebuilds them on a fresh pool."""
+    _POOLED_FACTORIES.append(factory)
+    return factory
+
+
+async def close_http_client():
+    """Closes the shared client if it was ever opened."""
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+    for factory in _POOLED_FACTORIES:
+        factory.cache_clear()
+
+
+def pooled_gemini(model: str, temperature: float) -> ChatGoogleGenerativeAI:
+    """Builds a Gemini chat model whose async calls use the shared connection pool."""
+    llm = ChatGoogleGenerativeAI(model=model, temperature=temperature)
+
+    # Only the plain API-key setup is rebuilt below; Vertex AI, explicit credentials
+    # or a custom endpoint keep the stock client and its own connections.
+    if (
+        llm.google_api_key is None
+        or llm.credentials is not None
+        or getattr(llm, "_use_vertexai", False)
+        or llm.base_url
+        or llm.client_args
+    ):
+        return llm
+
+    # langchain-google-genai has no hook for a custom httpx client and always builds
+    # its own client while validating, so swap in a google-genai client built on ours
+    # with the same headers (the SDK never closes an injected client).
+    _, user_agent = get_user_agent("ChatGoogleGenerativeAI")
+    stock_client = llm.client
+    llm.client = genai.Client(
+        api_key=llm.google_api_key.get_secret_value(),
+        http_options=HttpOptions(
+            api_version=llm.api_version,
+            headers={"user-agent": user_agent, **(llm.additional_headers or {})},
+            httpx_async_client=get_http_client()
+        )
+    )
+
+    # Release the stock client's unused transports now rather than when the model
+    # is collected, and let the model's cleanup hook track the client it really uses
+    llm._client_cleanup = _ClientCleanup(llm.client)
+    stock_client.close()
+    return llm
+
+
+async def create_context_cache(llm: ChatGoogleGenerativeAI, system_instruction: str, context: str, ttl: str = "300s"):
+    """Stores a system instruction plus a large context block as Gemini cached content.
+
+    Returns the cache name to pass as `cached_content`, or None if the API refuses
+    (e.g. the context is below the model's minimum cacheable size) or cannot be
+    reached; callers then fall back to sending the full prompt.
+    """
+    try:
+        cache = await llm.client.aio.caches.create(
+            model=llm.model,
+            config=CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=[Content(role="user", parts=[Part(text=context)])],
+                ttl=ttl
+            )
+        )
+    except (errors.APIError, httpx.HTTPError):
+        return None
+    return cache.name
+
+
+async def delete_context_cache(llm: ChatGoogleGenerativeAI, name: str):
+    """Deletes a context cache once it is no longer needed, so its storage stops
+    being billed before the TTL runs out. Failures are ignored; the TTL still applies."""
+    try:
+        await llm.client.aio.caches.delete(name=name)
+    except (errors.APIError, httpx.HTTPError):
+        pass
+
+
+class PooledTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+    """Tavily API wrapper whose async searches use the shared connection pool
+    (the stock wrapper opens a new aiohttp session for every search)."""
+
+    async def raw_results_async(
+        self,
+        query: str,
+        max_results=5,
+        search_depth="advanced",
+        include_domains=None,
+        exclude_domains=None,
+        include_answer=False,
+        include_raw_content=False,
+        include_images=False,
+    ) -> dict:
+        params = {
+            "api_key": self.tavily_api_key.get_secret_value(),
+            "query": query,
+            "max_results": max_results,
+            "search_depth": search_depth,
+            "include_domains": include_domains or [],
+            "exclude_domains": exclude_domains or [],
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "include_images": include_images,
+        }
+        response = await get_http_client().post(f"{TAVILY_API_URL}/search", json=params)
+        response.raise_for_status()
+        return response.json()
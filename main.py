@@ -1,11 +1,19 @@
 import os
-import hashlib
+import sys
+import asyncio
+import argparse
+import logging
+from contextlib import asynccontextmanager
+import xxhash
+import aiosqlite
 from dotenv import load_dotenv
 try:
-    from langgraph.checkpoint.sqlite import SqliteSaver
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 except ImportError:
-    from langgraph_checkpoint_sqlite import SqliteSaver
-from graphs.workflow import build_workflow
+    from langgraph_checkpoint_sqlite.aio import AsyncSqliteSaver
+from graphs.cache import CHECKPOINT_DB, SQLITE_PRAGMAS
+from graphs.transport import close_http_client
+from graphs.workflow import WORKFLOW
 
 # Task E: Load environment variables for tracing
 load_dotenv()
@@ -18,50 +26,57 @@ print(f"Gemini API Key: {'Set' if os.getenv('GEMINI_API_KEY') else 'Not Set'}")
 print(f"Tavily API Key: {'Set' if os.getenv('TAVILY_API_KEY') else 'Not Set'}")
 print()
 
+log = logging.getLogger(__name__)
 
-def run_qa_workflow(question: str):
-    """Execute the Q&A workflow with persistent memory and tracing"""
-    
-    # Task D: Setup SQLite checkpointer for persistent memory
-    with SqliteSaver.from_conn_string(
-        conn_string="checkpoints/langgraph_memory.sqlite"
-    ) as checkpointer:
-        
-        # Compile workflow with checkpointer
-        workflow = build_workflow().compile(checkpointer=checkpointer)
-        
-        # Task D: Generate unique thread_id from question for persistence
-        thread_id = hashlib.sha256(question.encode()).hexdigest()[:10]
-        
-        print(f"Thread ID: {thread_id}")
-        print(f"Question: {question}\n")
-        print("=" * 60)
-        print("Starting reflective Q&A workflow...")
-        print("=" * 60)
-        
-        # Execute workflow with config for persistence
-        config = {
-            "configurable": {
-                "thread_id": thread_id
-            }
-        }
-        
-        # Initialize state with retry_count
-        initial_state = {
-            "question": question,
-            "retry_count": 0
+# Upper bound on questions running through the graph at once in a batch
+BATCH_CONCURRENCY = 8
+
+
+def _thread_id(question: str) -> str:
+    """Task D: Generate unique thread_id from question for persistence
+    (a non-cryptographic hash is enough for a bucket key)"""
+    return xxhash.xxh3_64_hexdigest(question.encode())[:10]
+
+
+def _thread_config(question: str) -> dict:
+    return {
+        "configurable": {
+            "thread_id": _thread_id(question)
         }
+    }
+
+
+def _initial_state(question: str) -> dict:
+    # Initialize state with retry_count
+    return {
+        "question": question,
+        "retry_count": 0
+    }
+
+
+@asynccontextmanager
+async def _checkpointed_workflow():
+    """Yields the compiled workflow with a SQLite checkpointer attached."""
+    # Task D: Setup SQLite checkpointer for persistent memory
+    # (the graph nodes are async, so the checkpointer has to be as well)
+    async with aiosqlite.connect(CHECKPOINT_DB) as conn:
+        # Tune the connection before handing it over; checkpoints are written after every node
+        await conn.executescript(SQLITE_PRAGMAS)
+        checkpointer = AsyncSqliteSaver(conn)
         
-        # Invoke the workflow
-        result = workflow.invoke(initial_state, config=config)
-    
+        # Attach the checkpointer to the workflow compiled at import time
+        yield WORKFLOW.copy(update={"checkpointer": checkpointer})
+
+
+def _print_result(result: dict, thread_id: str):
     # Display results
     print("\n" + "=" * 60)
     print("=== WORKFLOW COMPLETE ===")
     print("=" * 60)
     print(f"\n📊 Statistics:")
     print(f"  - Total Research Iterations: {result.get('retry_count', 0)}")
-    print(f"  - Answer Accepted: {'Yes' if result.get('is_acceptable', False) else 'No'}")
+    # final_answer is only set once a draft is accepted (or served from the cache)
+    print(f"  - Answer Accepted: {'Yes' if result.get('final_answer') else 'No'}")
     print(f"  - Thread ID (for replay): {thread_id}")
     
     if result.get('reflection'):
@@ -70,28 +85,153 @@ def run_qa_workflow(question: str):
     print(f"\n" + "=" * 60)
     print("=== FINAL ANSWER ===")
     print("=" * 60)
-    print(result.get("final_answer", "No answer generated."))
+    # A cache miss resets final_answer to None, so fall back on any falsy value
+    print(result.get("final_answer") or "No answer generated.")
     print()
-    
+
+
+def _print_trace_info():
     # LangSmith trace information
     if os.getenv('LANGCHAIN_TRACING_V2') == 'true':
         print("\n🔍 View detailed trace in LangSmith:")
         print(f"   Project: {os.getenv('LANGCHAIN_PROJECT')}")
         print(f"   Check your LangSmith dashboard for node-by-node execution trace")
+
+
+async def run_qa_workflow(question: str):
+    """Execute the Q&A workflow with persistent memory and tracing"""
+    
+    async with _checkpointed_workflow() as workflow:
+        thread_id = _thread_id(question)
+        
+        print(f"Thread ID: {thread_id}")
+        print(f"Question: {question}\n")
+        print("=" * 60)
+        print("Starting reflective Q&A workflow...")
+        print("=" * 60)
+        
+        # Stream the workflow; with stream_mode="values" the last chunk is the final state
+        result = {}
+        async for state in workflow.astream(_initial_state(question), config=_thread_config(question), stream_mode="values"):
+            result = state
+    
+    _print_result(result, thread_id)
+    _print_trace_info()
     
     return result
 
 
+async def run_qa_workflow_batch(questions: list[str]):
+    """Execute the Q&A workflow for several questions concurrently on one checkpointer.
+    Returns the final states (or the exception a question failed with) in the order
+    of the (de-duplicated) questions."""
+    
+    # Repeats would share a thread_id and race on the same checkpoint thread
+    questions = list(dict.fromkeys(q for q in questions if q))
+    if not questions:
+        return []
+    
+    print(f"Running {len(questions)} questions (up to {BATCH_CONCURRENCY} at a time)...")
+    print("=" * 60)
+    
+    async with _checkpointed_workflow() as workflow:
+        # abatch reads the concurrency cap from the configs, not from its own kwargs;
+        # a failed question comes back as its exception instead of sinking the batch
+        results = await workflow.abatch(
+            [_initial_state(q) for q in questions],
+            config=[{**_thread_config(q), "max_concurrency": BATCH_CONCURRENCY} for q in questions],
+            return_exceptions=True
+        )
+    
+    for question, result in zip(questions, results):
+        print(f"\nQuestion: {question}")
+        if isinstance(result, Exception):
+            print(f"\n❌ Workflow failed: {result!r}")
+            continue
+        _print_result(result, _thread_id(question))
+    _print_trace_info()
+    
+    return results
+
+
+async def _run_once(question: str):
+    """Runs a single question, then closes the shared HTTP pool before the event loop exits."""
+    try:
+        return await run_qa_workflow(question)
+    finally:
+        await close_http_client()
+
+
+async def _run_batch(questions: list[str]):
+    """Runs a batch of questions, then closes the shared HTTP pool."""
+    try:
+        return await run_qa_workflow_batch(questions)
+    finally:
+        await close_http_client()
+
+
+async def _serve():
+    """Answers questions read from stdin until EOF or "exit", all on one event loop,
+    so the compiled graph, embedding model and HTTP pool stay warm between questions."""
+    try:
+        while True:
+            try:
+                question = (await asyncio.to_thread(input, "\nAsk me a question: ")).strip()
+            except EOFError:
+                break
+            if question.lower() in ("exit", "quit"):
+                break
+            if not question:
+                continue
+            # One failed question (a search or model error) must not end the server
+            try:
+                await run_qa_workflow(question)
+            except Exception:
+                log.exception("Workflow failed for question: %s", question)
+    finally:
+        await close_http_client()
+
+
+DEFAULT_QUESTION = "What are the latest developments in quantum computing in 2024?"
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Reflective research Q&A workflow")
+    parser.add_argument(
+        "question",
+        nargs="?",
+        help="question to answer (default: $QA_QUESTION, then a sample question)"
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--serve", action="store_true", help="keep answering questions typed on stdin")
+    mode.add_argument("--stdin-lines", action="store_true", help="answer one question per stdin line as a batch")
+    args = parser.parse_args()
+
+    # Both modes read their questions from stdin
+    if args.question is not None and (args.serve or args.stdin_lines):
+        parser.error("a question argument cannot be combined with --serve or --stdin-lines")
+    return args
+
+
 if __name__ == "__main__":
+    args = _parse_args()
+
+    # Node progress is logged by graphs.workflow; keep the per-request httpx lines out
+    logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[logging.StreamHandler()])
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
     # Ensure checkpoints directory exists
     os.makedirs("checkpoints", exist_ok=True)
     
-    # Get question from user or use default
-    question = input("\nAsk me a question: ").strip()
-    
-    if not question:
-        question = "What are the latest developments in quantum computing in 2024?"
-        print(f"Using default question: {question}")
-    
-    # Run the workflow
-    run_qa_workflow(question)
+    if args.serve:
+        asyncio.run(_serve())
+    elif args.stdin_lines:
+        asyncio.run(_run_batch([line.strip() for line in sys.stdin]))
+    else:
+        question = (args.question or os.getenv("QA_QUESTION") or "").strip()
+        if not question:
+            question = DEFAULT_QUESTION
+            print(f"Using default question: {question}")
+        
+        # Run the workflow
+        asyncio.run(_run_once(question))